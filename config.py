@@ -1,4 +1,31 @@
+import os
+
 # A list of common strings found in filenames that should be removed to improve
 # the accuracy of the movie title guess function.# This file should be edited 
 # as needed, and changes will be persistent across runs of the program.
-USER_SPECIFIED_STRINGS_FILE = "user-specified-strings.txt"
\ No newline at end of file
+USER_SPECIFIED_STRINGS_FILE = "user-specified-strings.txt"
+
+# SQLite file used to cache OMDb responses so that re-scanning a library does
+# not query the API again for movies that were already looked up. It is kept
+# in the user's cache directory so that it is shared by every working
+# directory the program is run from.
+OMDB_CACHE_FILE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "plex-media-organizer", "omdb-cache.sqlite3")
+
+# Number of seconds a cached OMDb response is considered fresh (3 days).
+OMDB_CACHE_TTL = 3 * 24 * 60 * 60
+
+# Number of seconds a cached "movie not found" response is considered fresh
+# (1 day). This is kept short so that renamed files are looked up again soon.
+OMDB_CACHE_MISS_TTL = 24 * 60 * 60
+
+# Most OMDb responses kept in memory at once. Older responses are still read
+# back from OMDB_CACHE_FILE when they are needed again.
+OMDB_MEMORY_CACHE_SIZE = 10000
+
+# Most OMDb requests sent per second, and the largest burst of requests sent
+# at once. Keeping under OMDb's rate limit avoids throttled responses that
+# have to be retried.
+OMDB_REQUESTS_PER_SECOND = 10
+OMDB_BURST_REQUESTS = 20
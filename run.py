@@ -1,13 +1,11 @@
 import argparse
 import os
 import sys
-sys.path.append('.')
 from pathlib import Path
 
-from keys import OMDB_API_KEY
-from plex_media_organizer import PlexMediaOrganizer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
 
-sys.path.append('src/')
+from plex_media_organizer import PlexMovieOrganizer
 
 def main():
     # Parse command-line arguments
@@ -15,18 +13,20 @@ def main():
     parser.add_argument('path', type=Path, help='path to the directory containing the media files')
     parser.add_argument('--silent', action='store_true', help='run without user input')
     parser.add_argument('--recursive', action='store_true', help='recurse into subdirectories')
+    parser.add_argument('--dry-run', action='store_true', help='print the planned changes without moving any files')
     args = parser.parse_args()
 
-    # Initialize PlexMediaOrganizer object
-    organizer = PlexMediaOrganizer(api_key=os.environ.get('OMDB_API_KEY') or OMDB_API_KEY)
+    # Initialize PlexMovieOrganizer object
+    organizer = PlexMovieOrganizer()
 
-    if not os.path.exists(args.path):
-        print(f"Error: Path {args.path} does not exist")
+    if not os.path.isdir(args.path):
+        print(f"Error: Directory {args.path} does not exist")
         return
 
-    if os.path.isfile(args.path):
-        changes = organizer.plan_filepath_changes(args.path, silent=args.silent, recurslive=args.recursive)
-        organizer.execute_filepath_changes(changes)
+    changes = organizer.organize(str(args.path), recursive=args.recursive,
+                                 silent=args.silent, dry_run=args.dry_run)
+    if args.dry_run:
+        organizer.print_planned_changes(changes)
 
 if __name__ == '__main__':
     main()
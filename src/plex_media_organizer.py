@@ -1,20 +1,224 @@
+import errno
+import functools
 import json
 import os
 import requests
 import re
+import shutil
+import sqlite3
 import sys
+import threading
+import time
 
 project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
 sys.path.append(project_dir)
 
-from typing import Dict, List, Optional, Tuple
-
-from config import USER_SPECIFIED_STRINGS_FILE
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib3.util.retry import Retry
+
+# orjson decodes OMDb responses and cached movie data faster than the json
+# module, but is optional
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+from config import (OMDB_BURST_REQUESTS, OMDB_CACHE_FILE, OMDB_CACHE_MISS_TTL,
+                    OMDB_CACHE_TTL, OMDB_MEMORY_CACHE_SIZE,
+                    OMDB_REQUESTS_PER_SECOND, USER_SPECIFIED_STRINGS_FILE)
 from keys import OMDB_API_KEY
 
+__all__ = ["PlexMovieOrganizer"]
+
+class _SeparatorTable(dict):
+    """
+    str.translate table that turns every character that is not a letter or a
+    digit into a space. Entries are filled in the first time a character is
+    seen, so the table covers all of Unicode without being built up front.
+    """
+
+    def __missing__(self, codepoint: int):
+        value = codepoint if chr(codepoint).isalnum() else ' '
+        self[codepoint] = value
+        return value
+
+
+# Translation table that separates the words of a filename with spaces.
+_SEPARATORS = _SeparatorTable()
+
+# Extensions of the video files that are organized, in lowercase.
+_VIDEO_EXTS = ('.avi', '.mp4', '.mkv', '.mov', '.m4v', '.webm')
+
+# Words that are left lowercase in a title unless they are the first word.
+_LOWERCASE_WORDS = frozenset({
+    'a', 'an', 'and', 'at', 'for', 'in', 'of', 'on', 'or', 'the', 'to',
+})
+
+# Subdirectories that never hold the main movie file, in lowercase. Sample
+# clips and Plex extras would otherwise be renamed as the movie, and NAS
+# metadata directories are only slow to read.
+_SKIP_DIRS = frozenset({
+    'sample', 'samples', 'extras', 'featurettes', 'behind the scenes',
+    'deleted scenes', 'trailers', '.appledouble', '@eadir',
+})
+
+# Characters that may not appear in file and directory names, by target
+# operating system.
+_INVALID_CHARS_RES = {
+    'windows': re.compile(r'[<>:"/\\|?*]'),
+    'macos': re.compile(r'[/\0]'),
+    'linux': re.compile(r'[/\0]'),
+}
+
+# OMDb API endpoint. It is queried over HTTPS so the API key is not sent in
+# the clear; the pooled session keeps the TLS connections alive between
+# requests.
+_OMDB_API_URL = "https://www.omdbapi.com/"
+
+# Seconds to wait for OMDb to connect or send data before giving up.
+_OMDB_TIMEOUT = 5
+
+# Version of the omdb_cache table layout. Caches written with a different
+# version are discarded and rebuilt. Version 2 keys rows by lowercase title.
+_CACHE_SCHEMA_VERSION = 2
+
+
+class _TokenBucket:
+    """
+    Thread-safe token bucket that limits how often an action may happen.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate (float): The number of tokens added per second.
+            capacity (float): The most tokens that can be saved up, i.e. the
+                              largest burst allowed.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Takes a token, blocking until one is available.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            # Reserve a token now and sleep off any shortfall outside the
+            # lock, so callers are released in order at the bucket's rate
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _TTLCache:
+    """
+    Thread-safe mapping that holds at most maxsize entries, each for a limited
+    number of seconds. When it is full, the least recently used entry is
+    evicted.
+    """
+
+    def __init__(self, maxsize: int):
+        """
+        Args:
+            maxsize (int): The most entries kept at once.
+        """
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Looks up an entry that has not expired.
+
+        Args:
+            key: The key of the entry.
+
+        Returns:
+            The value of the entry, or None if there is none or it expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float) -> None:
+        """
+        Adds or replaces an entry.
+
+        Args:
+            key: The key of the entry.
+            value: The value of the entry.
+            ttl (float): The number of seconds the entry is kept for.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=8192)
+def _normalize_title(title: str) -> Tuple[str, Optional[str]]:
+    """
+    Turns a filename into a capitalized, space separated title. Sample,
+    subtitle and multi-part files often share a name, so results are cached.
+
+    Args:
+        title (str): The filename without its extension.
+
+    Returns:
+        Tuple[str, Optional[str]]: The title with any trailing year removed,
+                                   and the year, or None if there was none.
+    """
+
+    # Split filename into its alphanumeric words in a single pass
+    parts = title.translate(_SEPARATORS).split()
+
+    # If the last part is a four digit number, assume it's the year and remove
+    # it. A number on its own, as in '1917', is the title.
+    year = None
+    if len(parts) > 1 and parts[-1].isdigit() and len(parts[-1]) == 4:
+        year = parts.pop()
+
+    # Capitalize each word, except for short connecting words that do not
+    # start the title, and join them with spaces
+    return ' '.join(
+        part.lower() if i and part.lower() in _LOWERCASE_WORDS else part.capitalize()
+        for i, part in enumerate(parts)), year
+
 
 class PlexMovieOrganizer:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 cache_file: Optional[str] = OMDB_CACHE_FILE,
+                 max_workers: int = 16):
         """
         Creates an instance of the PlexMediaOrganizer class.
 
@@ -23,25 +227,83 @@ class PlexMovieOrganizer:
                         environment variable "OMDB_API_KEY". If not found there, 
                         it will try to import the key from a module named "keys"
                         in the current working directory.
+        :param cache_file: (Optional) The SQLite file used to cache OMDb
+                        responses between runs. Defaults to OMDB_CACHE_FILE
+                        from config.py. Pass None to disable the on-disk cache.
+        :param max_workers: (Optional) The number of OMDb requests to have in
+                        flight at once while planning changes. Defaults to 16.
         """
 
         if api_key is None:
             api_key = os.environ.get('OMDB_API_KEY') or OMDB_API_KEY
         self.api_key = api_key
-
-    def organize(self, dir_path: str, recursive: bool = False):
+        self.max_workers = max_workers
+
+        # Pooled keep-alive connections to OMDb, one per lookup worker, shared
+        # by all requests so the TLS handshake is only paid once. OMDb throttles
+        # bursts of requests, so rate limited and failed requests are retried
+        # with a backoff. The last response is returned once the retries run
+        # out, so that only the one title fails.
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.2,
+                        status_forcelist=(429, 500, 502, 503, 504),
+                        raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers,
+                              max_retries=retries)
+        self.session.mount('https://', adapter)
+
+        # Keeps concurrent lookups under OMDb's request rate
+        self._rate_limiter = _TokenBucket(OMDB_REQUESTS_PER_SECOND,
+                                          OMDB_BURST_REQUESTS)
+
+        # Read the user specified strings once rather than for every title
+        self.reload_user_specified_strings()
+
+        # In-process cache of OMDb responses keyed by (lowercase title, year).
+        # It is bounded and expires entries like the on-disk cache, so a
+        # long-lived organizer neither grows without limit nor serves stale
+        # data.
+        self._movie_data_cache = _TTLCache(OMDB_MEMORY_CACHE_SIZE)
+
+        # On-disk cache of OMDb responses shared between runs. Lookups may run
+        # on worker threads, so access to the connection is serialized. The
+        # cache only saves requests, so the organizer works without it if it
+        # cannot be opened.
+        self._cache_db = None
+        self._cache_lock = threading.Lock()
+        if cache_file is not None:
+            try:
+                self._cache_db = self._open_cache_db(cache_file)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Warning! Unable to open OMDb cache {cache_file}: {e}. "
+                      "Continuing without it")
+
+    def organize(self,
+                 dir_path: str,
+                 recursive: bool = False,
+                 silent: bool = False,
+                 dry_run: bool = False) -> Optional[Dict[str, str]]:
         """
         Organizes media files in a directory.
 
         :param dir_path: The path to the directory containing the media files.
         :param recursive: If True, the program will recursively search the
                         directory for media files. Defaults to False.
+        :param silent: If True, the program will not ask for user input.
+                        Defaults to False.
+        :param dry_run: If True, no files are moved and the planned changes
+                        are returned instead. Defaults to False.
+        :return: The planned changes if dry_run is True, otherwise None.
         """
 
         # Execute the filepath changes
-        self.organize_movies(dir_path, recursive)
+        return self.organize_movies(dir_path, recursive, silent, dry_run)
 
-    def organize_movies(self, dir_path: str, recursive: bool = False):
+    def organize_movies(self,
+                        dir_path: str,
+                        recursive: bool = False,
+                        silent: bool = False,
+                        dry_run: bool = False) -> Optional[Dict[str, str]]:
         """
         Organizes movie and related files in a directory.
 
@@ -49,20 +311,22 @@ class PlexMovieOrganizer:
                         files.
         :param recursive: If True, the program will recursively search the
                         directory for movie files. Defaults to False.
+        :param silent: If True, the program will not ask for user input.
+                        Defaults to False.
+        :param dry_run: If True, no files are moved and the planned changes
+                        are returned instead. Defaults to False.
+        :return: The planned changes if dry_run is True, otherwise None.
         """
 
-        # Get a list of all movie files in the directory
-        movie_files = self.get_movie_files(dir_path, recursive)
-
-        # Get a list of all movie files with their metadata
-        movie_data = self.get_movie_data(movie_files)
-
-        # Plan the filepath changes
-        changes = self.plan_filepath_changes(movie_data)
+        if dry_run:
+            return self.plan_changes(dir_path, recursive, silent)
 
-        # Execute the filepath changes
-        self.execute_filepath_changes(changes)
+        # Move each file as soon as its change is planned instead of building
+        # the whole plan first. The directory walk has finished by the time
+        # the first change is planned, so the moves cannot disturb it.
+        self._apply_changes(self._iter_changes(dir_path, recursive, silent))
 
+        return None
 
     def execute_filepath_changes(self, changes: Dict[str, str]) -> None:
         """
@@ -75,24 +339,113 @@ class PlexMovieOrganizer:
         Returns:
             None
         """
-        for old_path, new_path in changes.items():
-            # Create directories in the new file path if they don't exist
-            new_dir = os.path.dirname(new_path)
-            if not os.path.exists(new_dir):
-                try:
-                    os.makedirs(new_dir)
-                except OSError as e:
-                    print(f"Error creating directory {new_dir}: {e}")
+        self._apply_changes(changes.items())
+
+    def _apply_changes(self, changes: Iterable[Tuple[str, str]]) -> None:
+        """
+        Moves files to their new paths on a thread pool, as the changes
+        arrive.
+
+        Args:
+            changes (Iterable[Tuple[str, str]]): The original filepath of each
+                file and the filepath to change it to.
+
+        Returns:
+            None
+        """
+        # Names already in each directory that files are moved into, or None
+        # if the directory could not be created. Each directory is created
+        # and listed once. Files planned onto the same path as an earlier
+        # file are skipped here, since the renames below run concurrently.
+        # Like _is_taken, this ignores case, since paths that only differ in
+        # case name the same file on Windows and macOS.
+        existing_names: Dict[str, Optional[set]] = {}
+        new_paths = set()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for old_path, new_path in changes:
+                if new_path.lower() in new_paths:
+                    print(f"Warning! File {new_path} already exists. Skipping")
+                    continue
+                new_paths.add(new_path.lower())
+
+                # Create directories in the new file path if they don't exist
+                new_dir = os.path.dirname(new_path)
+                if new_dir not in existing_names:
+                    existing_names[new_dir] = self._prepare_dir(new_dir)
+                names = existing_names[new_dir]
+                if names is None:
                     continue
 
-            # Rename the file
-            if not os.path.exists(new_path):
-                try:
-                    os.rename(old_path, new_path)
-                except OSError as e:
-                    print(f"Error renaming file {old_path}: {e}")
-            else:
-                print(f"Warning! File {new_path} already exists. Skipping")
+                # Rename the file
+                if self._is_taken(old_path, new_path, names):
+                    print(f"Warning! File {new_path} already exists. Skipping")
+                    continue
+                executor.submit(self._move_file, old_path, new_path)
+
+    def _prepare_dir(self, new_dir: str) -> Optional[set]:
+        """
+        Creates a directory that files are moved into, if it doesn't exist,
+        and lists the names already in it. Checking the planned names against
+        the listing takes one call per directory instead of one per file.
+
+        Args:
+            new_dir (str): The directory to create.
+
+        Returns:
+            Optional[set]: The lowercase names of the entries in the
+                           directory, or None if it could not be created or
+                           read.
+        """
+        try:
+            os.makedirs(new_dir, exist_ok=True)
+            return {name.lower() for name in os.listdir(new_dir)}
+        except OSError as e:
+            print(f"Error creating directory {new_dir}: {e}")
+            return None
+
+    def _is_taken(self, old_path: str, new_path: str, names: set) -> bool:
+        """
+        Checks whether a file would be overwritten by moving another file to
+        its path.
+
+        Args:
+            old_path (str): The current path of the file to move.
+            new_path (str): The path to move the file to.
+            names (set): The lowercase names in the directory of new_path, as
+                         returned by _prepare_dir.
+
+        Returns:
+            bool: True if a different file already exists at new_path.
+        """
+        # Names are compared case-insensitively, since os.replace would
+        # overwrite a file whose name only differs in case on Windows and
+        # macOS. Only changing the case of the file's own name is allowed.
+        new_name = os.path.basename(new_path).lower()
+        return new_name in names and old_path.lower() != new_path.lower()
+
+    def _move_file(self, old_path: str, new_path: str) -> None:
+        """
+        Moves a file to a new path in an existing directory. Any file already
+        at the new path is replaced, so callers check for one with _is_taken
+        first.
+
+        Args:
+            old_path (str): The current path of the file.
+            new_path (str): The path to move the file to.
+
+        Returns:
+            None
+        """
+        try:
+            try:
+                os.replace(old_path, new_path)
+            except OSError as e:
+                # Moving to another filesystem needs a copy
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(old_path, new_path)
+        except OSError as e:
+            print(f"Error renaming file {old_path}: {e}")
 
     def fetch_movie_data(self,
                          title: str,
@@ -108,46 +461,193 @@ class PlexMovieOrganizer:
                            Defaults to False.
 
         Returns:
-            dict: A dictionary containing movie data, or an empty dictionary if
-            no data was found.
+            dict: A dictionary containing movie data, or None if no data was
+            found.
         """
 
         # Try to get data from OMDB API
-        movie_data = self.request_movie_data(title, year)
+        movie_data = self._find_movie_data(title, year)
+
+        return self._check_movie_data(title, year, movie_data, silent)
+
+    def _check_movie_data(self,
+                          title: str,
+                          year: Optional[str],
+                          movie_data: Optional[dict],
+                          silent: bool = False) -> Optional[dict]:
+        """
+        Checks that OMDb found a movie, and otherwise asks the user for a
+        title to search for instead.
+
+        Args:
+            title (str): The title of the movie that was searched for.
+            year (str, optional): The year the movie was released.
+            movie_data (dict, optional): The OMDb response for the title, or
+                                         None if the request failed.
+            silent (bool): If true, the program will not ask for user input.
+                           Defaults to False.
+
+        Returns:
+            dict: A dictionary containing movie data, or None if no data was
+            found.
+        """
 
         # If movie data is empty and guess is enabled, try to guess the movie title
         if not movie_data or movie_data['Response'] == 'False':
             if not silent:
                 response = input(f"Unable to fetch movie data for {title}. To try again, please specify a movie title to search for? (Press Enter to skip)")
-                return None # TODO Remove return None and implement lines below
                 if response != '':
-                   # TODO Implement
-                   # self.format_movie_name(response) 
-                   print ("Not yet implemented, skipping for now")
+                    # Search again with the title the user gave
+                    return self.fetch_movie_data(response, year, silent)
+            return None
 
         # Return the movie data
         return movie_data
 
+    def fetch_movie_data_batch(
+            self,
+            titles: List[Tuple[str, Optional[str]]]) -> List[Optional[dict]]:
+        """
+        Fetches movie data for many movies at once. Up to max_workers
+        requests are sent to the OMDb API concurrently, and each distinct
+        title is only requested once. A movie that is not found in its year is
+        searched for again with the year as part of its title. The user is
+        never asked for input.
+
+        Args:
+            titles (List[Tuple[str, Optional[str]]]): The (title, year) of
+                each movie. The year may be None.
+
+        Returns:
+            List[Optional[dict]]: The movie data for each movie, in the same
+                order as titles, or None where no data was found.
+        """
+
+        lookups: Dict[Tuple[str, str], Future] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            keys = [self._submit_lookup(executor, lookups, title, year)
+                    for title, year in titles]
+
+        batch = []
+        for (title, year), key in zip(titles, keys):
+            movie_data = self._lookup_result(lookups[key], title)
+            if not movie_data or movie_data['Response'] == 'False':
+                movie_data = None
+            batch.append(movie_data)
+
+        return batch
+
+    def _submit_lookup(self,
+                       executor: ThreadPoolExecutor,
+                       lookups: Dict[Tuple[str, str], Future],
+                       title: str,
+                       year: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Starts looking up a movie on a thread pool, unless the same title was
+        already submitted.
+
+        Args:
+            executor (ThreadPoolExecutor): The pool to run the lookup on.
+            lookups (Dict[Tuple[str, str], Future]): The lookups submitted so
+                far, keyed by (lowercase title, year). The new lookup is added.
+            title (str): The title of the movie to search for.
+            year (str, optional): The year the movie was released. Defaults to None.
+
+        Returns:
+            Tuple[str, str]: The key of the lookup in lookups.
+        """
+
+        # Key lookups the same way as the caches, so titles that only differ
+        # in case are looked up once
+        key = (title.lower(), year or '')
+        if key not in lookups:
+            lookups[key] = executor.submit(self._find_movie_data, title, year)
+        return key
+
+    def _find_movie_data(self,
+                         title: str,
+                         year: Optional[str] = None) -> Optional[dict]:
+        """
+        Looks up a movie by title and year. If OMDb has no movie with the
+        title from that year, the year may be part of the title, as in
+        'Blade Runner 2049', so the title and year are searched for together.
+        Failing that, the title is searched for in any year, since the year
+        in a filename may be a festival or release year that is off by one.
+
+        Args:
+            title (str): The title of the movie to search for.
+            year (str, optional): The year the movie was released. Defaults to None.
+
+        Returns:
+            Optional[dict]: The OMDb response, or None if the title is empty
+                            or the request failed.
+        """
+
+        # An empty title cannot match a movie
+        if not title.strip():
+            return None
+
+        movie_data = self.request_movie_data(title, year)
+        if year and movie_data is not None and movie_data['Response'] == 'False':
+            movie_data = self.request_movie_data(f"{title} {year}")
+            if movie_data is not None and movie_data['Response'] == 'False':
+                movie_data = self.request_movie_data(title)
+
+        return movie_data
+
+    def _lookup_result(self, lookup: Future, title: str) -> Optional[dict]:
+        """
+        Waits for a lookup submitted with _submit_lookup. A lookup that
+        raised is reported and treated as a failed request.
+
+        Args:
+            lookup (Future): The lookup to wait for.
+            title (str): The title that was searched for.
+
+        Returns:
+            Optional[dict]: The OMDb response, or None if the lookup failed.
+        """
+        try:
+            return lookup.result()
+        except Exception as e:
+            print(f"Error fetching movie data for {title}: {e}")
+            return None
+
     def clean_movie_title(self, title:str) -> str:
+        """
+        Cleans a movie filename into a title to search OMDb for.
 
-        # Split filename into parts
-        parts = title.split('._-')
+        Args:
+            title (str): The filename, with or without its video extension.
 
-        # Remove any non-alphanumeric characters from each part
-        for i in range(len(parts)):
-            parts[i] = re.sub('[^0-9a-zA-Z]+', ' ', parts[i])
-        
-        # If the last part is a four digit number, assume it's the year and remove it
-        if parts[-1].isdigit() and len(parts[-1]) == 4:
-            parts.pop()
+        Returns:
+            str: The cleaned movie title.
+        """
+        return self._parse_movie_title(title)[0]
+
+    def _parse_movie_title(self, title: str) -> Tuple[str, Optional[str]]:
+        """
+        Cleans a movie filename into a title and year to search OMDb for.
+
+        Args:
+            title (str): The filename, with or without its video extension.
+
+        Returns:
+            Tuple[str, Optional[str]]: The cleaned movie title, and the year
+                                       at the end of the filename, or None.
+        """
 
-        # Join the parts with spaces and capitalize each word
-        partially_clean_filename = ' '.join(parts).title()
+        # Drop a video extension; the dot is known to exist, so slicing is
+        # enough
+        if title.lower().endswith(_VIDEO_EXTS):
+            title = title[:title.rfind('.')]
+
+        partially_clean_filename, year = _normalize_title(title)
 
         # Remove User Specified Strings
         clean_filename = self.remove_user_specified_strings(name=partially_clean_filename)
 
-        return clean_filename
+        return clean_filename, year
         
 
     def format_movie_filename(self, movie_data: dict) -> str:
@@ -161,13 +661,8 @@ class PlexMovieOrganizer:
             str: The formatted name of the movie file
         """
 
-        # Construct the new filename according to the Plex naming convention
         if movie_data is not None:
-            new_filename = f'{movie_data["Title"]} ({movie_data["Year"]})'
-            if 'imdbID' in movie_data:
-                new_filename += f' ({movie_data["imdbID"]})'
-        
-            return self.remove_invalid_chars(new_filename)
+            return self._format_movie_names(movie_data)[0]
         return None
 
 
@@ -182,10 +677,33 @@ class PlexMovieOrganizer:
             str: The formatted name of the movie directory
         """
         if movie_data is not None:
-            new_dirname = f'{movie_data["Title"]} ({movie_data["Year"]})'
-            return self.remove_invalid_chars(new_dirname)
+            return self._format_movie_names(movie_data)[1]
         return None
 
+    def _format_movie_names(self, movie_data: dict) -> Tuple[str, str]:
+        """
+        Formats the file and directory names of a movie together, so the
+        'Title (Year)' they share is only built and sanitized once.
+
+        Args:
+            movie_data (dict): The collection containing movie information.
+
+        Returns:
+            Tuple[str, str]: The movie filename without extension and the
+                             movie directory name.
+        """
+
+        # Construct the new names according to the Plex naming convention
+        new_dirname = self.remove_invalid_chars(
+            f'{movie_data["Title"]} ({movie_data["Year"]})')
+
+        # IMDb IDs are 'tt' followed by digits, so they need no sanitizing
+        new_filename = new_dirname
+        if 'imdbID' in movie_data:
+            new_filename += f' ({movie_data["imdbID"]})'
+
+        return new_filename, new_dirname
+
     def remove_invalid_chars(self, input_str: str, os_type: str = 'windows') -> str:
         """
         Removes all invalid characters from a string, making it suitable for use as a movie name or directory name.
@@ -198,20 +716,21 @@ class PlexMovieOrganizer:
             str: The processed string with invalid characters removed.
         """
 
-        # Define the invalid characters based on the target operating system
-        if os_type == 'windows':
-            invalid_chars = r'[<>:"/\\|?*]'
-        elif os_type in ['macos', 'linux']:
-            invalid_chars = r'[/\0]'
-        else:
-            raise ValueError(f"Unsupported os_type: {os_type}. Use 'windows', 'macos', or 'linux'.")
+        # Look up the invalid characters based on the target operating system
+        try:
+            invalid_chars_re = _INVALID_CHARS_RES[os_type]
+        except KeyError:
+            raise ValueError(f"Unsupported os_type: {os_type}. Use 'windows', 'macos', or 'linux'.") from None
 
         # Remove invalid characters using a regular expression
-        cleaned_str = re.sub(invalid_chars, '', input_str)
+        cleaned_str = invalid_chars_re.sub('', input_str)
 
         return cleaned_str
 
-    def plan_changes(self, dir_path: str, recursive: bool = False) -> Dict[str, str]:
+    def plan_changes(self,
+                     dir_path: str,
+                     recursive: bool = False,
+                     silent: bool = False) -> Dict[str, str]:
         """
         Plans the renaming and moving of a movie file.
 
@@ -219,67 +738,150 @@ class PlexMovieOrganizer:
             dir_path (str): The directory path to the movie file(s).
             recursive (bool, optional): If True, the function will recurse into
                                         subdirectories
+            silent (bool, optional): If True, the function will not ask for
+                                     user input when a movie is not found.
 
         Returns:
             Dict[str, str]]: A dictionary containing the original filepaths and
                              the filepaths to change to, or None if no changes 
                              are needed.
         """
-        changes = {}
-        
-        def plan_change(file_path: str) -> Optional[Tuple[str, str]]:
-            file_ext = os.path.splitext(file_path)[1]
-            if file_ext not in [".avi", ".mp4", ".mkv", ".mov"]:
-                return None
+        return dict(self._iter_changes(dir_path, recursive, silent))
 
-            # Extract the filename from the pathname
-            filename = os.path.basename(file_path)
+    def _iter_changes(self,
+                      dir_path: str,
+                      recursive: bool = False,
+                      silent: bool = False) -> Iterator[Tuple[str, str]]:
+        """
+        Yields the renaming and moving planned for each movie file as soon as
+        its movie data has been fetched.
 
-            filename_without_ext, _ = os.path.splitext(filename)
-            
-            clean_title = self.clean_movie_title(filename_without_ext)
+        Args:
+            dir_path (str): The directory path to the movie file(s).
+            recursive (bool, optional): If True, the function will recurse into
+                                        subdirectories
+            silent (bool, optional): If True, the function will not ask for
+                                     user input when a movie is not found.
 
-            # Fetch movie data
-            movie_data = self.fetch_movie_data(clean_title) 
+        Yields:
+            Tuple[str, str]: The original filepath of a movie file and the
+                             filepath to change it to. Files that are already
+                             in place are not yielded.
+        """
 
-            if movie_data is None:
-                print(f"Unable to query filename: {filename}")
-                return
+        # Pick up edits made to the user specified strings since the last plan
+        self._refresh_user_specified_strings()
 
-            # Format movie title
-            formatted_movie_filename = self.format_movie_filename(movie_data)
+        # Directory that the movie directories are created in, keyed by the
+        # directory the movie files are in. Files in the same directory share
+        # it, so the path is only taken apart once per directory.
+        parent_dirs: Dict[str, str] = {}
 
-            # Format directory name
-            formatted_movie_dirname = self.format_movie_dirname(movie_data)
+        def plan_change(entry: os.DirEntry,
+                        file_ext: str,
+                        movie_data: dict) -> Optional[Tuple[str, str]]:
+            # Format movie title and directory name
+            formatted_movie_filename, formatted_movie_dirname = \
+                self._format_movie_names(movie_data)
 
-            parent_dir = os.path.dirname(os.path.dirname(file_path))
+            file_path = entry.path
+            dir_key = file_path[:len(file_path) - len(entry.name)]
+            parent_dir = parent_dirs.get(dir_key)
+            if parent_dir is None:
+                parent_dir = os.path.dirname(os.path.dirname(file_path))
+                parent_dirs[dir_key] = parent_dir
 
             # Construct new file path
-            new_filename = formatted_movie_filename + file_ext
-            new_parent_dir = os.path.join(parent_dir, formatted_movie_dirname)
-            new_pathname = os.path.join(new_parent_dir, new_filename)
+            new_pathname = os.path.join(parent_dir, formatted_movie_dirname,
+                                        formatted_movie_filename + file_ext)
 
             if new_pathname != file_path:
                 return file_path, new_pathname
             else:
                 return None
 
-        if recursive:
-            for dirpath, _, filenames in os.walk(dir_path):
-                for filename in filenames:
-                    file_path = os.path.join(dirpath, filename)
-                    change = plan_change(file_path)
-                    if change:
-                        changes[change[0]] = change[1]
-        else:
-            for filename in os.listdir(dir_path):
-                full_path = os.path.join(dir_path, filename)
-                if os.path.isfile(full_path):
-                    change = plan_change(full_path)
-                    if change:
-                        changes[change[0]] = change[1]
-                
-        return changes
+        # Collect the movie files along with the title to search for. Each
+        # title is queried on the thread pool as soon as it is found, so the
+        # OMDb lookups overlap with the directory walk, and the results are
+        # read back from the lookups below. Files that share a title, such as
+        # multi-part rips, are only queried once.
+        movies = []
+        lookups: Dict[Tuple[str, str], Future] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for entry in self._iter_files(dir_path, recursive, _VIDEO_EXTS):
+                # The walk only yields names ending in a video extension, so
+                # the last dot always starts the extension
+                dot = entry.name.rfind('.')
+                filename_without_ext, file_ext = entry.name[:dot], entry.name[dot:]
+                clean_title, year = self._parse_movie_title(filename_without_ext)
+                key = self._submit_lookup(executor, lookups, clean_title, year)
+                movies.append((entry, file_ext, clean_title, year, key))
+
+        for entry, file_ext, clean_title, year, key in movies:
+            # Fetch movie data
+            movie_data = self._check_movie_data(
+                clean_title, year, self._lookup_result(lookups[key], clean_title),
+                silent)
+
+            if movie_data is None:
+                print(f"Unable to query filename: {entry.name}")
+                continue
+
+            change = plan_change(entry, file_ext, movie_data)
+            if change:
+                yield change
+
+    def _iter_files(self,
+                    dir_path: str,
+                    recursive: bool = False,
+                    extensions: Optional[Tuple[str, ...]] = None) -> Iterator[os.DirEntry]:
+        """
+        Yields the files in a directory using os.scandir, whose entries carry
+        the file type so no extra stat call is needed per file.
+
+        Args:
+            dir_path (str): The directory to list.
+            recursive (bool, optional): If True, files in subdirectories are
+                                        yielded as well. Symbolic links to
+                                        directories and the directories in
+                                        _SKIP_DIRS are not entered.
+            extensions (Tuple[str, ...], optional): If given, only files with
+                                        one of these lowercase extensions are
+                                        yielded. Other entries are skipped
+                                        before their type is checked.
+
+        Yields:
+            os.DirEntry: An entry for each file found.
+        """
+
+        # Walk the tree with an explicit stack instead of recursion, so deep
+        # trees neither hit the recursion limit nor keep a directory handle
+        # open per level
+        dir_paths = [dir_path]
+        while dir_paths:
+            current_dir = dir_paths.pop()
+            try:
+                entries = os.scandir(current_dir)
+            except OSError as e:
+                # The directory that was asked for must be readable
+                if current_dir == dir_path:
+                    raise
+                print(f"Error reading directory {current_dir}: {e}")
+                continue
+
+            with entries:
+                for entry in entries:
+                    if recursive and entry.is_dir(follow_symlinks=False):
+                        if entry.name.lower() not in _SKIP_DIRS:
+                            dir_paths.append(entry.path)
+                        continue
+
+                    if (extensions is not None
+                            and not entry.name.lower().endswith(extensions)):
+                        continue
+
+                    if entry.is_file():
+                        yield entry
 
     def remove_user_specified_strings(self, name: str): 
         """
@@ -291,20 +893,56 @@ class PlexMovieOrganizer:
         Returns:
             str: The updated filename with common strings removed.
         """
-        if os.path.exists(USER_SPECIFIED_STRINGS_FILE):
+        if self._user_specified_strings_re is None:
+            return name
+
+        # Remove common strings from filename in a single pass
+        return self._user_specified_strings_re.sub("", name)
+
+    def reload_user_specified_strings(self) -> None:
+        """
+        Reads USER_SPECIFIED_STRINGS_FILE and combines its strings into the
+        single pattern used by remove_user_specified_strings. Call this after
+        editing the file to pick up the changes without creating a new
+        organizer.
+
+        Returns:
+            None
+        """
+        try:
             with open(USER_SPECIFIED_STRINGS_FILE, "r") as f:
-                user_specified_strings = f.readlines()
-                # Remove newline characters from each line
-                user_specified_strings = [s.strip() for s in user_specified_strings]
-        else:
-            # If the common strings file doesn't exist, create an empty list
+                self._user_specified_strings_mtime = os.fstat(f.fileno()).st_mtime_ns
+                user_specified_strings = [s.strip() for s in f if s.strip()]
+        except FileNotFoundError:
+            self._user_specified_strings_mtime = None
             user_specified_strings = []
 
-        # Remove common strings from filename
-        for s in user_specified_strings:
-            name = name.replace(s, "")
+        # Match longest first so that overlapping strings are removed whole.
+        # Titles are capitalized before the strings are removed, so the
+        # strings match in any case.
+        if user_specified_strings:
+            user_specified_strings.sort(key=len, reverse=True)
+            self._user_specified_strings_re = re.compile(
+                '|'.join(map(re.escape, user_specified_strings)), re.IGNORECASE)
+        else:
+            self._user_specified_strings_re = None
+
+    def _refresh_user_specified_strings(self) -> None:
+        """
+        Reloads the user specified strings if USER_SPECIFIED_STRINGS_FILE was
+        created, changed or removed since it was last read. This costs one
+        stat call, so it is done once per plan rather than once per title.
 
-        return name
+        Returns:
+            None
+        """
+        try:
+            mtime = os.stat(USER_SPECIFIED_STRINGS_FILE).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime != self._user_specified_strings_mtime:
+            self.reload_user_specified_strings()
 
     def save_common_strings(common_strings):
         """
@@ -325,8 +963,13 @@ class PlexMovieOrganizer:
         """
         Function to fetch movie data from OMDb API.
 
+        Responses are cached in memory and on disk for OMDB_CACHE_TTL seconds,
+        or OMDB_CACHE_MISS_TTL seconds if OMDb did not find the movie. At most
+        OMDB_MEMORY_CACHE_SIZE responses are kept in memory.
+
         Args:
             title (str): The title of the movie to search for.
+            year (str, optional): The year the movie was released. Defaults to None.
 
         Returns:
             Optional[Dict[str, Any]]: A dictionary containing the movie data if
@@ -338,6 +981,41 @@ class PlexMovieOrganizer:
 
         """
 
+        # OMDb matches titles case-insensitively, so the caches do too
+        key = (title.lower(), year or '')
+
+        # Check the in-process cache, then the on-disk cache
+        movie_data = self._movie_data_cache.get(key)
+        if movie_data is not None:
+            return movie_data
+
+        movie_data = self._load_cached_movie_data(key)
+        if movie_data is None:
+            movie_data = self._query_omdb(title, year)
+            if movie_data is not None:
+                self._store_cached_movie_data(key, movie_data)
+
+        if movie_data is not None:
+            found = movie_data.get('Response') == 'True'
+            self._movie_data_cache.set(
+                key, movie_data, OMDB_CACHE_TTL if found else OMDB_CACHE_MISS_TTL)
+
+        return movie_data
+
+    def _query_omdb(self, title: str, year: Optional[str] = None) -> Optional[dict]:
+        """
+        Sends a single title query to the OMDb API, bypassing the caches.
+
+        Args:
+            title (str): The title of the movie to search for.
+            year (str, optional): The year the movie was released. Defaults to None.
+
+        Returns:
+            Optional[dict]: The decoded JSON response, or None if the request
+                            was not successful. Failed requests are not
+                            cached, so they are tried again next time.
+        """
+
         # Create a dictionary to store the API parameters
         params = {"apikey": self.api_key, "t": title}
 
@@ -345,17 +1023,125 @@ class PlexMovieOrganizer:
         if year:
             params["y"] = year
 
-        # Make a request to the OMDb API
-        response = requests.get("http://www.omdbapi.com/", params=params)
+        # Wait for our turn, then make a request to the OMDb API. A timeout
+        # keeps a stalled connection from holding up a lookup thread
+        # indefinitely. A request that fails after its retries only skips
+        # this title rather than stopping the whole run.
+        self._rate_limiter.acquire()
+        try:
+            response = self.session.get(_OMDB_API_URL, params=params,
+                                        timeout=_OMDB_TIMEOUT)
+
+            # Check if the request was successful and return the JSON data if it was
+            if response.status_code == 200:
+                return _json_loads(response.content)
+        except (requests.RequestException, ValueError) as e:
+            # Only name the error, since its message includes the request URL
+            # and with it the API key
+            print(f"Error querying OMDb for {title}: {type(e).__name__}")
 
-        # Check if the request was successful and return the JSON data if it was
-        if response.status_code == 200:
-            return response.json()
-        else:
+        return None
+
+    def _open_cache_db(self, cache_file: str) -> sqlite3.Connection:
+        """
+        Opens the on-disk OMDb cache, creating its directory and the
+        omdb_cache table if needed, and deletes the entries that are too old
+        to be used.
+
+        Args:
+            cache_file (str): The path to the SQLite file.
+
+        Returns:
+            sqlite3.Connection: A connection that may be used from any thread
+                                while holding the cache lock.
+
+        Raises:
+            OSError: If the cache directory cannot be created.
+            sqlite3.Error: If the file cannot be opened as a cache, for
+                           example because it is not a SQLite database.
+        """
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        cache_db = sqlite3.connect(cache_file, check_same_thread=False)
+        try:
+            # Drop caches written with an older table layout
+            schema_version = cache_db.execute("PRAGMA user_version").fetchone()[0]
+            if schema_version != _CACHE_SCHEMA_VERSION:
+                cache_db.execute("DROP TABLE IF EXISTS omdb_cache")
+                cache_db.execute(f"PRAGMA user_version = {_CACHE_SCHEMA_VERSION}")
+
+            cache_db.execute(
+                "CREATE TABLE IF NOT EXISTS omdb_cache ("
+                "title TEXT, year TEXT, json TEXT, found INTEGER, fetched_at REAL, "
+                "PRIMARY KEY (title, year))")
+
+            # Lookups ignore stale entries, so they would otherwise only grow
+            # the file
+            now = time.time()
+            cache_db.execute(
+                "DELETE FROM omdb_cache "
+                "WHERE fetched_at <= CASE WHEN found THEN ? ELSE ? END",
+                (now - OMDB_CACHE_TTL, now - OMDB_CACHE_MISS_TTL))
+            cache_db.commit()
+        except sqlite3.Error:
+            cache_db.close()
+            raise
+
+        return cache_db
+
+    def _load_cached_movie_data(self, key: Tuple[str, str]) -> Optional[dict]:
+        """
+        Looks up a fresh OMDb response in the on-disk cache.
+
+        Args:
+            key (Tuple[str, str]): The (lowercase title, year) the movie was
+                                   queried by.
+
+        Returns:
+            Optional[dict]: The cached movie data, or None if there is no entry
+                            younger than OMDB_CACHE_TTL (OMDB_CACHE_MISS_TTL for
+                            movies that were not found).
+        """
+        if self._cache_db is None:
             return None
 
+        now = time.time()
+        with self._cache_lock:
+            row = self._cache_db.execute(
+                "SELECT json FROM omdb_cache "
+                "WHERE title = ? AND year = ? "
+                "AND fetched_at > CASE WHEN found THEN ? ELSE ? END",
+                (*key, now - OMDB_CACHE_TTL, now - OMDB_CACHE_MISS_TTL)).fetchone()
+
+        return _json_loads(row[0]) if row else None
+
+    def _store_cached_movie_data(self, key: Tuple[str, str], movie_data: dict) -> None:
+        """
+        Saves an OMDb response to the on-disk cache.
+
+        Args:
+            key (Tuple[str, str]): The (lowercase title, year) the movie was
+                                   queried by.
+            movie_data (dict): The OMDb response to cache.
+
+        Returns:
+            None
+        """
+        if self._cache_db is None:
+            return
+
+        found = movie_data.get('Response') == 'True'
+        with self._cache_lock:
+            self._cache_db.execute(
+                "INSERT OR REPLACE INTO omdb_cache "
+                "(title, year, json, found, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (*key, json.dumps(movie_data), found, time.time()))
+            self._cache_db.commit()
+
     def print_planned_changes(self, changes: Dict[str, str]) -> None:
-        print("Ppreview_changeslanned changes:")
+        print("Planned changes:")
         for old_path, new_path in changes.items():
             print(f"{old_path} -> {new_path}")
 
@@ -1,13 +1,19 @@
+import json
 import os
 import pytest
+import requests
 import shutil
 import sys
+import time
 from pathlib import Path
+from types import SimpleNamespace
 from typing import Dict
 
 src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
 sys.path.append(src_dir)
 
+import plex_media_organizer
+from config import OMDB_CACHE_MISS_TTL, OMDB_CACHE_TTL
 from plex_media_organizer import PlexMovieOrganizer 
 from keys import OMDB_API_KEY
 
@@ -16,8 +22,9 @@ def api_key():
     return OMDB_API_KEY
 
 @pytest.fixture(scope='module')
-def plex_movie_organizer(api_key):
-    return PlexMovieOrganizer(api_key=api_key)
+def plex_movie_organizer(api_key, tmp_path_factory):
+    cache_file = tmp_path_factory.mktemp('cache') / 'omdb-cache.sqlite3'
+    return PlexMovieOrganizer(api_key=api_key, cache_file=str(cache_file))
 
 
 @pytest.fixture
@@ -106,6 +113,289 @@ def test_format_movie_filename(plex_movie_organizer):
     # Assert that the output matches the expected result
     assert formatted_filename == expected_filename
 
+@pytest.mark.parametrize("title, expected", [
+    ("avengers.endgame", "Avengers Endgame"),
+    ("toy_story", "Toy Story"),
+    ("Inception.2010", "Inception"),
+    ("the-matrix_(1999)", "The Matrix"),
+    ("amélie.2001", "Amélie"),
+    ("THE.LORD.OF.THE.RINGS", "The Lord of the Rings"),
+    ("avengers.endgame.mov", "Avengers Endgame"),
+    ("Toy_Story.1995.MP4", "Toy Story"),
+    ("heat.1995.webm", "Heat"),
+    ("1917.mkv", "1917"),
+    ("", ""),
+])
+def test_clean_movie_title(title, expected, plex_movie_organizer):
+    assert plex_movie_organizer.clean_movie_title(title) == expected
+
+def test_remove_user_specified_strings(api_key, tmp_path, monkeypatch):
+    # Overlapping strings are removed longest first, and blank lines ignored
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "user-specified-strings.txt").write_text("Bluray\n\nBluray Remux\n1080p\n")
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=None)
+
+    assert organizer.remove_user_specified_strings("Heat Bluray Remux") == "Heat "
+    assert organizer.remove_user_specified_strings("Heat 1080p") == "Heat "
+
+    # Edits to the file are picked up on reload
+    (tmp_path / "user-specified-strings.txt").write_text("Heat\n")
+    organizer.reload_user_specified_strings()
+    assert organizer.remove_user_specified_strings("Heat 1080p") == " 1080p"
+
+    # Strings match regardless of case
+    (tmp_path / "user-specified-strings.txt").write_text(
+        "1080P\nThe Criterion Collection\n")
+    organizer.reload_user_specified_strings()
+    assert organizer.remove_user_specified_strings("Heat 1080p") == "Heat "
+    assert organizer.remove_user_specified_strings(
+        "Heat the Criterion Collection") == "Heat "
+
+class FakeOMDb:
+    """
+    Stands in for the OMDb API and records the (title, year) of each query.
+    respond is called with the title and year, and returns the movie data,
+    None if the movie is not found, or raises to fail the request. By
+    default only Inception is found.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.respond = self.find_inception
+
+    @property
+    def titles(self):
+        return [title for title, year in self.queries]
+
+    @staticmethod
+    def find_inception(title, year):
+        if title == "Inception":
+            return {"Title": "Inception", "Year": "2010"}
+        return None
+
+    def get(self, url, params=None, **kwargs):
+        self.queries.append((params["t"], params.get("y")))
+        movie_data = self.respond(params["t"], params.get("y"))
+        if movie_data is None:
+            movie_data = {"Response": "False", "Error": "Movie not found!"}
+        else:
+            movie_data = {**movie_data, "Response": "True"}
+        return SimpleNamespace(status_code=200,
+                               content=json.dumps(movie_data).encode())
+
+@pytest.fixture
+def omdb(monkeypatch):
+    fake_omdb = FakeOMDb()
+    # A bound method is not bound again, so it stands in for Session.get
+    monkeypatch.setattr(requests.Session, 'get', fake_omdb.get)
+    return fake_omdb
+
+@pytest.mark.parametrize("title, response", [
+    ("Inception", "True"),
+    ("Not A Movie", "False"),
+])
+def test_request_movie_data_cache(title, response, api_key, tmp_path, omdb):
+    cache_file = str(tmp_path / 'omdb-cache.sqlite3')
+
+    # Later lookups are served from memory, regardless of case
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=cache_file)
+    assert organizer.request_movie_data(title)["Response"] == response
+    assert organizer.request_movie_data(title)["Response"] == response
+    assert organizer.request_movie_data(title.upper())["Response"] == response
+    assert omdb.titles == [title]
+
+    # A new organizer is served from disk
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=cache_file)
+    assert organizer.request_movie_data(title)["Response"] == response
+    assert omdb.titles == [title]
+
+def test_request_movie_data_error(tmp_path, omdb, capsys):
+    # A failed request only skips its title, and is not cached. The error
+    # is reported without the request URL, which holds the API key.
+    def respond(title, year):
+        raise requests.exceptions.ConnectionError(
+            f"Max retries exceeded with url: /?apikey=secret-key&t={title}")
+
+    omdb.respond = respond
+    organizer = PlexMovieOrganizer(
+        api_key="secret-key", cache_file=str(tmp_path / 'omdb-cache.sqlite3'))
+
+    assert organizer.request_movie_data("Inception") is None
+    assert organizer.request_movie_data("Inception") is None
+    assert omdb.titles == ["Inception", "Inception"]
+
+    output = capsys.readouterr().out
+    assert "Error querying OMDb for Inception: ConnectionError" in output
+    assert "secret-key" not in output
+
+def test_plan_changes_lookup_error(api_key, tmp_path, omdb):
+    # A title whose request fails is skipped after a single request, and the
+    # other files are still planned
+    def respond(title, year):
+        if title == "Inception":
+            return FakeOMDb.find_inception(title, year)
+        raise requests.exceptions.Timeout("OMDb timed out")
+
+    omdb.respond = respond
+    for name in ("Inception", "Heat"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / f"{name.lower()}.mkv").write_text("")
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=None)
+
+    changes = organizer.plan_changes(str(tmp_path), recursive=True, silent=True)
+
+    assert list(changes) == [str(tmp_path / "Inception" / "inception.mkv")]
+    assert sorted(omdb.titles) == ["Heat", "Inception"]
+
+def test_fetch_movie_data_year(api_key, omdb):
+    # The year is searched for separately, then as part of the title, then
+    # not at all when no movie matches it. Empty titles are not searched for.
+    def respond(title, year):
+        if (title, year) in (("Inception", "2010"), ("Blade Runner 2049", None),
+                             ("Heat", None)):
+            return {"Title": title}
+        return None
+
+    omdb.respond = respond
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=None)
+    batch = organizer.fetch_movie_data_batch(
+        [("Inception", "2010"), ("Blade Runner", "2049"), ("Heat", "1996"),
+         ("", None)])
+
+    assert [movie_data and movie_data["Title"] for movie_data in batch] == \
+        ["Inception", "Blade Runner 2049", "Heat", None]
+    assert sorted(omdb.queries, key=lambda query: (query[0], query[1] or '')) == [
+        ("Blade Runner", "2049"), ("Blade Runner 2049", None),
+        ("Heat", None), ("Heat", "1996"), ("Heat 1996", None),
+        ("Inception", "2010")]
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Replace the organizer's monotonic clock with one the test moves forward
+    clock = SimpleNamespace(now=0.0)
+    fake_time = SimpleNamespace(monotonic=lambda: clock.now, time=time.time,
+                                sleep=time.sleep)
+    monkeypatch.setattr(plex_media_organizer, 'time', fake_time)
+    return clock
+
+def test_ttl_cache_expiry(clock):
+    cache = plex_media_organizer._TTLCache(maxsize=10)
+    cache.set("key", "value", ttl=10)
+
+    clock.now = 9.9
+    assert cache.get("key") == "value"
+    clock.now = 10
+    assert cache.get("key") is None
+    assert cache.get("missing") is None
+
+def test_ttl_cache_eviction(clock):
+    # The least recently used entry is evicted once maxsize is exceeded
+    cache = plex_media_organizer._TTLCache(maxsize=2)
+    cache.set("a", 1, ttl=10)
+    cache.set("b", 2, ttl=10)
+    assert cache.get("a") == 1
+    cache.set("c", 3, ttl=10)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+def test_request_movie_data_memory_ttl(api_key, clock, omdb):
+    # Misses expire from memory after OMDB_CACHE_MISS_TTL, and found movies
+    # after OMDB_CACHE_TTL
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=None)
+    organizer.request_movie_data("Inception")
+    organizer.request_movie_data("Not A Movie")
+
+    clock.now = OMDB_CACHE_MISS_TTL
+    organizer.request_movie_data("Inception")
+    organizer.request_movie_data("Not A Movie")
+    assert omdb.titles == ["Inception", "Not A Movie", "Not A Movie"]
+
+    clock.now = OMDB_CACHE_TTL
+    organizer.request_movie_data("Inception")
+    assert omdb.titles[-1] == "Inception"
+    assert len(omdb.titles) == 4
+
+def test_iter_files_skip_dirs(plex_movie_organizer, tmp_path):
+    # Sample clips, extras and NAS metadata are not walked into, but files
+    # at the top level and in other directories are yielded
+    for path in ("heat.mkv", "Heat/heat.mkv", "Heat/Sample/heat.sample.mkv",
+                 "Heat/Extras/trailer.mkv", "@eaDir/heat.mkv"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("")
+
+    entries = plex_movie_organizer._iter_files(str(tmp_path), recursive=True)
+
+    assert sorted(os.path.relpath(entry.path, tmp_path) for entry in entries) == \
+        [os.path.join("Heat", "heat.mkv"), "heat.mkv"]
+
+def test_cache_db_prune(api_key, tmp_path):
+    # Entries too old to be used are deleted when the cache is opened
+    cache_file = str(tmp_path / 'omdb-cache.sqlite3')
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=cache_file)
+    now = time.time()
+    organizer._cache_db.executemany(
+        "INSERT INTO omdb_cache VALUES (?, '', '{}', ?, ?)",
+        [("old hit", True, now - OMDB_CACHE_TTL - 1),
+         ("fresh hit", True, now - OMDB_CACHE_MISS_TTL - 1),
+         ("old miss", False, now - OMDB_CACHE_MISS_TTL - 1),
+         ("fresh miss", False, now)])
+    organizer._cache_db.commit()
+
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=cache_file)
+    rows = organizer._cache_db.execute("SELECT title FROM omdb_cache")
+    assert sorted(title for title, in rows) == ["fresh hit", "fresh miss"]
+
+def test_cache_db_unusable(api_key, tmp_path, omdb, capsys):
+    # A cache file that is not a database is reported, and lookups go to
+    # OMDb without it
+    cache_file = tmp_path / 'omdb-cache.sqlite3'
+    cache_file.write_bytes(b"not a database" * 100)
+
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=str(cache_file))
+
+    assert "Unable to open OMDb cache" in capsys.readouterr().out
+    assert organizer.request_movie_data("Inception")["Title"] == "Inception"
+    assert omdb.titles == ["Inception"]
+
+def test_fetch_movie_data_batch(api_key, omdb):
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=None)
+    batch = organizer.fetch_movie_data_batch(
+        [("Inception", None), ("Not A Movie", None), ("INCEPTION", None)])
+
+    assert [movie_data and movie_data["Title"] for movie_data in batch] == \
+        ["Inception", None, "Inception"]
+    assert sorted(omdb.titles) == ["Inception", "Not A Movie"]
+
+def test_fetch_movie_data_user_title(api_key, omdb, monkeypatch):
+    # A title typed in after a miss is searched for, and Enter skips
+    answers = iter(["Inception", ""])
+    monkeypatch.setattr('builtins.input', lambda prompt: next(answers))
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=None)
+
+    assert organizer.fetch_movie_data("Incepshun")["Title"] == "Inception"
+    assert organizer.fetch_movie_data("Not A Movie") is None
+    assert omdb.titles == ["Incepshun", "Inception", "Not A Movie"]
+
+def test_organize(api_key, tmp_path, omdb):
+    movie_path = tmp_path / "movies" / "Inception" / "inception.mkv"
+    new_path = tmp_path / "movies" / "Inception (2010)" / "Inception (2010).mkv"
+    movie_path.parent.mkdir(parents=True)
+    movie_path.write_text("")
+    organizer = PlexMovieOrganizer(api_key=api_key, cache_file=None)
+
+    # A dry run returns the plan and leaves the files in place
+    changes = organizer.organize(str(tmp_path / "movies"), recursive=True,
+                                 silent=True, dry_run=True)
+    assert changes == {str(movie_path): str(new_path)}
+    assert movie_path.exists()
+    assert not new_path.parent.exists()
+
+    # Otherwise the files are moved as planned
+    assert organizer.organize(str(tmp_path / "movies"), recursive=True,
+                              silent=True) is None
+    assert not movie_path.exists()
+    assert new_path.exists()
+
 @pytest.mark.parametrize("movies_dir, expected", [
     ("simple_movie_path_structure", "expected_simple"), 
     ("large_movie_path_structure", "expected_large")
@@ -152,3 +442,39 @@ def test_execute_filepath_changes(movies_dir, plex_movie_organizer, request):
 
     print_directory_tree(test_movie_path)
 
+def test_execute_filepath_changes_existing(plex_movie_organizer, tmp_path):
+    # Files are never moved over a file already at the new path, even one
+    # whose name only differs in case
+    (tmp_path / "Heat").mkdir()
+    (tmp_path / "Heat" / "heat.mkv").write_text("old")
+    (tmp_path / "Heat (1995)").mkdir()
+    (tmp_path / "Heat (1995)" / "heat (1995).mkv").write_text("existing")
+
+    plex_movie_organizer.execute_filepath_changes({
+        str(tmp_path / "Heat" / "heat.mkv"):
+            str(tmp_path / "Heat (1995)" / "Heat (1995).mkv"),
+    })
+
+    assert (tmp_path / "Heat" / "heat.mkv").read_text() == "old"
+    assert os.listdir(tmp_path / "Heat (1995)") == ["heat (1995).mkv"]
+    assert (tmp_path / "Heat (1995)" / "heat (1995).mkv").read_text() == "existing"
+
+def test_execute_filepath_changes_same_target(plex_movie_organizer, tmp_path):
+    # Of two files planned onto paths that only differ in case, only the
+    # first is moved
+    for name in ("Heat", "Heat2"):
+        (tmp_path / name).mkdir()
+    (tmp_path / "Heat" / "heat.1995.mkv").write_text("first")
+    (tmp_path / "Heat2" / "HEAT.MKV").write_text("second")
+
+    plex_movie_organizer.execute_filepath_changes({
+        str(tmp_path / "Heat" / "heat.1995.mkv"):
+            str(tmp_path / "Heat (1995)" / "Heat (1995).mkv"),
+        str(tmp_path / "Heat2" / "HEAT.MKV"):
+            str(tmp_path / "Heat (1995)" / "Heat (1995).MKV"),
+    })
+
+    assert os.listdir(tmp_path / "Heat (1995)") == ["Heat (1995).mkv"]
+    assert (tmp_path / "Heat (1995)" / "Heat (1995).mkv").read_text() == "first"
+    assert (tmp_path / "Heat2" / "HEAT.MKV").read_text() == "second"
+